@@ -1,19 +1,39 @@
 from flask import Flask
 from app.config import Config
-from app.utils import get_current_user_from_session
-import os
+from app.json_provider import ORJSONProvider
+from app.sessions import CachedSecureCookieSessionInterface
+from pathlib import Path
+
+
+class LJCoursesFlask(Flask):
+    def get_send_file_max_age(self, filename):
+        """Let browsers cache profile photos instead of revalidating them on every page"""
+        if filename and filename.startswith('uploads/profile_photos/'):
+            return self.config['PROFILE_PHOTO_CACHE_MAX_AGE']
+        return super().get_send_file_max_age(filename)
+
 
 def create_app(config_class=Config):
-    app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    app = LJCoursesFlask(__name__, template_folder='../templates', static_folder='../static')
     app.config.from_object(config_class)
+    app.json = ORJSONProvider(app)
+    app.session_interface = CachedSecureCookieSessionInterface()
+
+    # Imported here so `import app` doesn't build the engine or load every service module
+    from app.db import close_db
+    from app.utils import get_current_user_from_session
+
+    app.teardown_appcontext(close_db)
 
     # Context processors
     @app.context_processor
     def inject_user():
         return dict(current_user=get_current_user_from_session())
 
-    # Ensure upload directory exists
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Resolve the upload directory once, against the project root rather than the
+    # working directory, so saving and deleting photos always use the same folder
+    app.config['UPLOAD_FOLDER'] = Path(app.root_path).parent / app.config['UPLOAD_FOLDER']
+    app.config['UPLOAD_FOLDER'].mkdir(parents=True, exist_ok=True)
 
     # Register Blueprints
     from app.routes import auth, student, course
@@ -21,4 +41,18 @@ def create_app(config_class=Config):
     app.register_blueprint(student.bp)
     app.register_blueprint(course.bp)
 
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing database tables."""
+        from app.db import init_db
+        init_db()
+        print("✓ Database tables created")
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Create missing tables and indexes and add cascading foreign keys on an existing database."""
+        from app.db import upgrade_db
+        upgrade_db()
+        print("✓ Database upgraded")
+
     return app
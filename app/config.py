@@ -5,9 +5,24 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'ljcourses-secret-key-2026')
-    UPLOAD_FOLDER = os.path.join('static', 'uploads', 'profile_photos')
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+    UPLOAD_FOLDER = os.path.join('static', 'uploads', 'profile_photos')  # Relative to the project root; create_app resolves it to a Path
+    ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'webp'})
+    ALLOWED_IMAGE_MIMETYPES = frozenset({'image/png', 'image/jpeg', 'image/jpg', 'image/webp'})
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    PROFILE_PHOTO_CACHE_MAX_AGE = 7 * 24 * 3600  # Profile photos are named by content hash, so never change (lesson videos keep fixed names)
+    MAX_PROFILE_PHOTO_SIZE = 5 * 1024 * 1024  # 5MB, matches the client-side check
+    # werkzeug hash method for passwords, e.g. 'scrypt' or 'pbkdf2:sha256:600000'; existing hashes are upgraded on login
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    LAST_LOGIN_WRITE_INTERVAL = int(os.getenv('LAST_LOGIN_WRITE_INTERVAL', 300))  # Seconds before a repeat login updates last_login
+    LAST_ACCESSED_WRITE_INTERVAL = int(os.getenv('LAST_ACCESSED_WRITE_INTERVAL', 60))  # Seconds before a lesson view updates enrollment.last_accessed
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))  # Seconds a cached session user stays fresh
+    USER_CACHE_MAX = int(os.getenv('USER_CACHE_MAX', 10000))
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', 300))  # Seconds cached category lists and catalog pages stay fresh
+    # Development aid: make unplanned lazy loads raise instead of silently issuing N+1 queries
+    SQLA_RAISE_LOAD = os.getenv('SQLA_RAISE_LOAD') == '1'
     DATABASE_URL = os.getenv('DATABASE_URL')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # Seconds before a pooled connection is replaced
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL is not set in the environment variables")
@@ -1,18 +1,106 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, raiseload
+from flask import g
 from app.config import Config
 
-engine = create_engine(Config.DATABASE_URL)
+engine = create_engine(
+    Config.DATABASE_URL,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sessions live for one request, so keep loaded state after commit instead of
+# re-SELECTing every instance the next time it is read
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
+# Appended after a query's explicit eager loads; empty unless SQLA_RAISE_LOAD=1
+LAZY_LOAD_GUARD = (raiseload('*'),) if Config.SQLA_RAISE_LOAD else ()
+
 def get_db():
-    """Dependency to get database session"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+    """Database session for the current request (opened on first use)"""
+    if 'db' not in g:
+        g.db = SessionLocal()
+    return g.db
+
+def close_db(exception=None):
+    """Return the request's session to the pool when the app context ends"""
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+
+def init_db():
+    """Create any missing tables (existing tables are left untouched)"""
+    from app import models  # noqa: F401 - registers the models on Base.metadata
+    Base.metadata.create_all(bind=engine)
+
+
+# Keep the most complete row of each (enrollment, lesson) pair so the unique
+# index on lesson_progress can be built: completed first, then the most recently
+# completed/accessed, with id only as a last resort (every column is coalesced,
+# since a NULL would make the row comparison NULL and keep both rows)
+_DEDUPE_LESSON_PROGRESS = text("""
+    DELETE FROM lesson_progress a USING lesson_progress b
+    WHERE a.enrollment_id = b.enrollment_id AND a.lesson_id = b.lesson_id
+      AND (COALESCE(a.is_completed, false),
+           COALESCE(a.completed_at, '-infinity'),
+           COALESCE(a.last_accessed, '-infinity'),
+           a.id)
+        < (COALESCE(b.is_completed, false),
+           COALESCE(b.completed_at, '-infinity'),
+           COALESCE(b.last_accessed, '-infinity'),
+           b.id)
+""")
+
+# The existing foreign key on a table column and its ON DELETE action ('c' = cascade)
+_FOREIGN_KEY_ON_COLUMN = text("""
+    SELECT c.conname, c.confdeltype FROM pg_constraint c
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+    WHERE c.contype = 'f' AND c.conrelid = to_regclass(:table) AND a.attname = :column
+""")
+
+def _upgrade_cascading_foreign_keys(conn):
+    """
+    Recreate foreign keys the models declare with ondelete='CASCADE' that an
+    older database still has without it (the delete services rely on the
+    database removing child rows)
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            if (fk.ondelete or '').upper() != 'CASCADE':
+                continue
+            existing = conn.execute(_FOREIGN_KEY_ON_COLUMN,
+                                    {'table': table.name, 'column': fk.parent.name}).first()
+            if existing is None or existing.confdeltype == 'c':
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {quote(table.name)} DROP CONSTRAINT {quote(existing.conname)},"
+                f" ADD CONSTRAINT {quote(existing.conname)} FOREIGN KEY ({quote(fk.parent.name)})"
+                f" REFERENCES {quote(fk.column.table.name)} ({quote(fk.column.name)}) ON DELETE CASCADE"
+            ))
+
+def upgrade_db():
+    """
+    Bring an existing database up to the models: create missing tables and
+    indexes (create_all skips indexes on tables that already exist), add
+    ON DELETE CASCADE to older foreign keys, and remove duplicate lesson
+    progress rows first so the unique progress index can be built
+    """
+    from app import models  # noqa: F401 - registers the models on Base.metadata
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _upgrade_cascading_foreign_keys(conn)
+        progress_index_exists = conn.execute(text(
+            "SELECT to_regclass('ix_lesson_progress_enrollment_lesson') IS NOT NULL"
+        )).scalar()
+        if not progress_index_exists:
+            conn.execute(_DEDUPE_LESSON_PROGRESS)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -2,14 +2,37 @@
 Database models for LJCourses platform
 """
 from datetime import datetime
+from functools import cache
 from app.db import Base
-from sqlalchemy import Column, String, Text, Boolean, DateTime, Integer, Float, ForeignKey, ARRAY, UniqueConstraint
+from app.config import Config
+from sqlalchemy import text, Column, String, Text, Boolean, DateTime, Integer, Float, ForeignKey, ARRAY, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, query_expression
 import uuid
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
+def hash_password(password):
+    """Hash a password with the configured PASSWORD_HASH_METHOD"""
+    return generate_password_hash(password, method=Config.PASSWORD_HASH_METHOD)
+
+
+@cache
+def _reference_hash():
+    """A hash made with PASSWORD_HASH_METHOD, computed once"""
+    return hash_password('')
+
+
+def _password_hash_prefix():
+    """Method and cost prefix (e.g. 'scrypt:32768:8:1') of hashes made with PASSWORD_HASH_METHOD"""
+    return _reference_hash().partition('$')[0]
+
+
+def check_dummy_password(password):
+    """Spend as long as a real password check, for logins with an unknown email"""
+    check_password_hash(_reference_hash(), password or '')
+
+
 class UserRole:
     STUDENT = 'student'
     INSTRUCTOR = 'instructor'
@@ -41,17 +64,21 @@ class User(Base):
     last_login = Column(DateTime, nullable=True)
 
     # Relationships
-    enrollments = relationship('Enrollment', back_populates='student', cascade='all, delete-orphan')
+    enrollments = relationship('Enrollment', back_populates='student', cascade='all, delete-orphan', passive_deletes=True)
     courses = relationship('Course', back_populates='instructor')
 
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         """Check if password matches hash"""
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """Whether the stored hash was made with a different method or cost than PASSWORD_HASH_METHOD"""
+        return self.password_hash.partition('$')[0] != _password_hash_prefix()
+
     def __repr__(self):
         return f'<User {self.email}>'
 
@@ -90,6 +117,8 @@ class Course(Base):
     slug = Column(String(200), nullable=False, unique=True, index=True)
     small_description = Column(Text, nullable=True)
     description = Column(Text, nullable=True)
+    # Start of the description, filled in only by queries that ask for it (catalog cards)
+    description_preview = query_expression()
     thumbnail = Column(String(500), nullable=True)
     
     # Course Details
@@ -110,8 +139,13 @@ class Course(Base):
     # Relationships
     instructor = relationship('User', back_populates='courses')
     category = relationship('Category', back_populates='courses')
-    lessons = relationship('Lesson', back_populates='course', cascade='all, delete-orphan', order_by='Lesson.order')
-    enrollments = relationship('Enrollment', back_populates='course', cascade='all, delete-orphan')
+    lessons = relationship('Lesson', back_populates='course', cascade='all, delete-orphan', order_by='Lesson.order', passive_deletes=True)
+    enrollments = relationship('Enrollment', back_populates='course', cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        # Keyset pagination order for the course catalog
+        Index('ix_courses_created_at_id', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return f'<Course {self.title}>'
@@ -122,11 +156,13 @@ class Enrollment(Base):
     __tablename__ = 'enrollments'
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    student_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
-    course_id = Column(UUID(as_uuid=True), ForeignKey('courses.id'), nullable=False)
+    student_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    course_id = Column(UUID(as_uuid=True), ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
     
     __table_args__ = (
         UniqueConstraint('student_id', 'course_id', name='uq_student_course'),
+        # My Courses lists a student's unfinished enrollments
+        Index('ix_enrollments_student_active', 'student_id', postgresql_where=text('completed_at IS NULL')),
     )
     
     # Timestamps
@@ -137,7 +173,7 @@ class Enrollment(Base):
     # Relationships
     student = relationship('User', back_populates='enrollments')
     course = relationship('Course', back_populates='enrollments')
-    lesson_progress = relationship('LessonProgress', back_populates='enrollment', cascade='all, delete-orphan')
+    lesson_progress = relationship('LessonProgress', back_populates='enrollment', cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Enrollment student={self.student_id} course={self.course_id}>'
@@ -148,7 +184,7 @@ class Lesson(Base):
     __tablename__ = 'lessons'
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    course_id = Column(UUID(as_uuid=True), ForeignKey('courses.id'), nullable=False)
+    course_id = Column(UUID(as_uuid=True), ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
     
     # Lesson Information
     order = Column(Integer, nullable=False)  # Order within the course
@@ -161,9 +197,14 @@ class Lesson(Base):
     created_at = Column(DateTime, default=datetime.now, nullable=False)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        # Lessons are always listed, and the next one found, in order within a course
+        Index('ix_lessons_course_order', 'course_id', 'order'),
+    )
+
     # Relationships
     course = relationship('Course', back_populates='lessons')
-    lesson_progress = relationship('LessonProgress', back_populates='lesson', cascade='all, delete-orphan')
+    lesson_progress = relationship('LessonProgress', back_populates='lesson', cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Lesson {self.title}>'
@@ -174,8 +215,14 @@ class LessonProgress(Base):
     __tablename__ = 'lesson_progress'
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    enrollment_id = Column(UUID(as_uuid=True), ForeignKey('enrollments.id'), nullable=False)
-    lesson_id = Column(UUID(as_uuid=True), ForeignKey('lessons.id'), nullable=False)
+    enrollment_id = Column(UUID(as_uuid=True), ForeignKey('enrollments.id', ondelete='CASCADE'), nullable=False)
+    lesson_id = Column(UUID(as_uuid=True), ForeignKey('lessons.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        # Progress lookups are always by enrollment, and often for one lesson in it;
+        # unique so each lesson has one progress row per enrollment (and can be upserted)
+        Index('ix_lesson_progress_enrollment_lesson', 'enrollment_id', 'lesson_id', unique=True),
+    )
     
     # Progress Information
     is_completed = Column(Boolean, default=False)
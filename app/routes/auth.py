@@ -1,8 +1,8 @@
+from uuid import UUID
 from flask import Blueprint, render_template, request, redirect, url_for, session
-from app.db import SessionLocal
-from app.services import get_user_by_email, create_user
-from datetime import datetime
-from app.utils import auth_required
+from app.db import get_db
+from app.services import get_user_by_email, user_email_exists, create_user, authenticate_and_touch, deactivate_user
+from app.utils import auth_required, get_current_user_from_session, invalidate_cached_user, user_to_dict
 
 bp = Blueprint('auth', __name__)
 
@@ -19,32 +19,27 @@ def student_login():
             email = request.form.get('email')
             password = request.form.get('password')
         
-        db = SessionLocal()
-        try:
-            user = get_user_by_email(db, email)
-            if user and user.check_password(password):
-                # Reactivate user if they were inactive
-                user.is_active = True
-                user.last_login = datetime.now()
-                db.commit()
-                
-                session['user_id'] = str(user.id)
-                session['user_name'] = user.full_name
-                session['user_role'] = user.role
-                
-                # If JSON request, return JSON response
-                if request.is_json or request.accept_mimetypes.accept_json:
-                    return {"success": True, "redirect_url": url_for('student.my_courses')}
-                
-                return redirect(url_for('student.my_courses'))
+        db = get_db()
+        # Verifies the password, reactivates the user and stamps last_login
+        user = authenticate_and_touch(db, email, password)
+        if user:
+            invalidate_cached_user(user.id)
+            
+            session['user_id'] = str(user.id)
+            session['user_name'] = user.full_name
+            session['user_role'] = user.role
             
-            # Login failed
+            # If JSON request, return JSON response
             if request.is_json or request.accept_mimetypes.accept_json:
-                return {"detail": "Invalid email or password"}, 401
-                
-            return render_template('student_login.html', error='Invalid email or password')
-        finally:
-            db.close()
+                return {"success": True, "redirect_url": url_for('student.my_courses')}
+            
+            return redirect(url_for('student.my_courses'))
+        
+        # Login failed
+        if request.is_json or request.accept_mimetypes.accept_json:
+            return {"detail": "Invalid email or password"}, 401
+            
+        return render_template('student_login.html', error='Invalid email or password')
     
     error = request.args.get('error')
     return render_template('student_login.html', error=error)
@@ -73,10 +68,10 @@ def student_sign_up():
                  return {"detail": "Passwords do not match"}, 400
              return render_template('student_sign_up.html', error='Passwords do not match')
 
-        db = SessionLocal()
+        db = get_db()
         try:
             # Check if user exists
-            if get_user_by_email(db, email):
+            if user_email_exists(db, email):
                 if request.is_json or request.accept_mimetypes.accept_json:
                     return {"detail": "Email already registered"}, 400
                 return render_template('student_sign_up.html', error='Email already registered')
@@ -97,8 +92,6 @@ def student_sign_up():
             if request.is_json or request.accept_mimetypes.accept_json:
                 return {"detail": str(e)}, 500
             return render_template('student_sign_up.html', error=str(e))
-        finally:
-            db.close()
 
     error = request.args.get('error')
     return render_template('student_sign_up.html', error=error)
@@ -107,20 +100,12 @@ def student_sign_up():
 @bp.route('/logout')
 def logout():
     """Log out the current user"""
-    from app.services import get_user_by_id  # Import locally to avoid circular imports if needed
-
     # Optional: set is_active to False on logout
     user_id = session.get('user_id')
     if user_id:
-        db = SessionLocal()
-        try:
-            user = get_user_by_id(db, user_id)
-            if user:
-                user.is_active = False
-                db.commit()
-        finally:
-            db.close()
-            
+        deactivate_user(get_db(), UUID(user_id))
+        invalidate_cached_user(user_id)
+
     session.clear()
     return redirect(url_for('course.home'))
 
@@ -129,7 +114,6 @@ def logout():
 @auth_required
 def change_password():
     """Change password page"""
-    from app.utils import get_current_user_from_session
     user = get_current_user_from_session()
     return render_template('change_password.html', user=user)
 
@@ -149,7 +133,7 @@ def api_reset_password():
     if new_password != confirm_password:
         return {"detail": "Passwords do not match"}, 400
         
-    db = SessionLocal()
+    db = get_db()
     try:
         # Check if user exists
         user = get_user_by_email(db, email)
@@ -162,33 +146,17 @@ def api_reset_password():
         return {"message": "Password updated successfully"}
     except Exception as e:
         return {"detail": str(e)}, 500
-    finally:
-        db.close()
 
 
 @bp.route('/api/auth/me', methods=['GET'])
 def api_auth_me():
     """Get current logged-in user details"""
-    from app.services import get_user_by_id
-
     if 'user_id' not in session:
          return {"detail": "Not authenticated"}, 401
     
-    db = SessionLocal()
-    try:
-        user = get_user_by_id(db, session['user_id'])
-        if not user:
-             return {"detail": "User not found"}, 404
-             
-        return {
-            "id": str(user.id),
-            "email": user.email,
-            "full_name": user.full_name,
-            "role": user.role,
-            "profile_image": user.profile_image,
-            "bio": user.bio,
-            "major": user.major,
-            "created_at": user.created_at.isoformat() if user.created_at else None
-        }
-    finally:
-        db.close()
+    # Cached snapshot: repeat calls don't touch the database
+    user = get_current_user_from_session()
+    if not user:
+         return {"detail": "User not found"}, 404
+         
+    return user_to_dict(user)
@@ -1,16 +1,16 @@
-from flask import Blueprint, render_template, request, url_for, session
-from app.db import SessionLocal
+from flask import Blueprint, render_template, request, url_for, session, current_app
+from app.db import get_db
 from app.models import Course, Enrollment, Lesson
 from app.services import (
-    get_all_courses, get_course_by_slug, get_course_by_id,
-    get_all_categories, get_category_by_slug, create_enrollment,
-    get_lesson_by_id, get_lessons_by_course,
-    create_lesson_progress, update_lesson_progress, get_progress_by_enrollment,
-    get_user_by_id
+    get_catalog_page, encode_course_cursor, decode_course_cursor, get_course_by_slug, get_course_by_id,
+    get_course_and_enrollment,
+    get_category_list, get_category_snapshot_by_slug, create_enrollment,
+    get_lesson_by_id,
+    create_lesson_progress, complete_lesson_progress, get_progress_rows, get_completion_counts
 )
-from app.utils import format_duration, get_current_user_from_session, auth_required
-from sqlalchemy.orm import joinedload
-from datetime import datetime
+from app.utils import format_duration, get_current_user_from_session, auth_required, api_auth_required
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, timedelta
 
 bp = Blueprint('course', __name__)
 
@@ -24,224 +24,220 @@ def home():
 def browse_courses():
     """Browse available courses page"""
     PER_PAGE = 9
-    db = SessionLocal()
-    try:
-        user = get_current_user_from_session()
-        
-        # Get filter parameters
-        category_slug = request.args.get('category')
-        search_query = request.args.get('q', '').strip()
-        page = request.args.get('page', 1, type=int)
-        
-        # Get all categories for filter buttons
-        categories = get_all_categories(db)
-        
-        # Get courses with optional category filter
-        category_id = None
-        if category_slug and category_slug != 'all':
-            category = get_category_by_slug(db, category_slug)
-            if category:
-                category_id = category.id
-        
-        skip = (page - 1) * PER_PAGE
-        courses = get_all_courses(db, skip=skip, limit=PER_PAGE, category_id=category_id, search=search_query or None)
-        
-        # Check if there are more courses
-        next_courses = get_all_courses(db, skip=skip + PER_PAGE, limit=1, category_id=category_id, search=search_query or None)
-        has_more = len(next_courses) > 0
-        
-        return render_template('browse-courses.html', 
-                             courses=courses, 
-                             categories=categories,
-                             selected_category=category_slug or 'all',
-                             search_query=search_query,
-                             user=user,
-                             format_duration=format_duration,
-                             current_page=page,
-                             has_more=has_more)
-    finally:
-        db.close()
+    db = get_db()
+    user = get_current_user_from_session()
+    
+    # Get filter parameters
+    category_slug = request.args.get('category')
+    search_query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    
+    # Get all categories for filter buttons
+    categories = get_category_list(db)
+    
+    # Get courses with optional category filter
+    category_id = None
+    if category_slug and category_slug != 'all':
+        category = get_category_snapshot_by_slug(db, category_slug)
+        if category:
+            category_id = category.id
+    
+    skip = (page - 1) * PER_PAGE
+    # Fetch one extra row to learn whether there is another page
+    courses = get_catalog_page(db, skip=skip, limit=PER_PAGE + 1, category_id=category_id, search=search_query or None)
+    has_more = len(courses) > PER_PAGE
+    courses = courses[:PER_PAGE]
+    
+    return render_template('browse-courses.html', 
+                         courses=courses, 
+                         categories=categories,
+                         selected_category=category_slug or 'all',
+                         search_query=search_query,
+                         user=user,
+                         format_duration=format_duration,
+                         current_page=page,
+                         has_more=has_more,
+                         next_cursor=encode_course_cursor(courses[-1]) if has_more else None)
+
+
+def _course_card(course):
+    """Serialize a course for the Load More course cards"""
+    return {
+        'title': course.title,
+        'slug': course.slug,
+        'thumbnail': course.thumbnail or '',
+        'rating': str(course.rating or '0.0'),
+        'duration': format_duration(course.duration_hours),
+        'small_description': course.small_description or (course.description[:100] + '...' if course.description else 'No description available.'),
+        'category_name': course.category.name if course.category else '',
+        'instructor_name': course.instructor.full_name if course.instructor else '',
+        'instructor_image': course.instructor.profile_image if course.instructor and course.instructor.profile_image else '/static/images/default-instructor.svg',
+        'url': url_for('course.course_overview', course_slug=course.slug),
+    }
 
 
 @bp.route('/api/browse-courses')
 def api_browse_courses():
     """API endpoint to fetch more courses for Load More button"""
     PER_PAGE = 9
-    db = SessionLocal()
-    try:
-        category_slug = request.args.get('category')
-        search_query = request.args.get('q', '').strip()
-        page = request.args.get('page', 1, type=int)
-        
-        category_id = None
-        if category_slug and category_slug != 'all':
-            category = get_category_by_slug(db, category_slug)
-            if category:
-                category_id = category.id
-        
-        skip = (page - 1) * PER_PAGE
-        courses = get_all_courses(db, skip=skip, limit=PER_PAGE, category_id=category_id, search=search_query or None)
-        
-        next_courses = get_all_courses(db, skip=skip + PER_PAGE, limit=1, category_id=category_id, search=search_query or None)
-        has_more = len(next_courses) > 0
-        
-        courses_data = []
-        for course in courses:
-            hours = course.duration_hours or 0
-            h = int(hours)
-            m = int((hours - h) * 60)
-            duration_str = f"{h}h {m}m" if m > 0 else f"{h}h"
-            
-            courses_data.append({
-                'title': course.title,
-                'slug': course.slug,
-                'thumbnail': course.thumbnail or '',
-                'rating': str(course.rating or '0.0'),
-                'duration': duration_str,
-                'small_description': course.small_description or (course.description[:100] + '...' if course.description else 'No description available.'),
-                'category_name': course.category.name if course.category else '',
-                'instructor_name': course.instructor.full_name if course.instructor else '',
-                'instructor_image': course.instructor.profile_image if course.instructor and course.instructor.profile_image else '/static/images/default-instructor.svg',
-                'url': url_for('course.course_overview', course_slug=course.slug),
-            })
-        
-        return {'courses': courses_data, 'has_more': has_more, 'page': page}
-    finally:
-        db.close()
+    db = get_db()
+    category_slug = request.args.get('category')
+    search_query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    
+    category_id = None
+    if category_slug and category_slug != 'all':
+        category = get_category_snapshot_by_slug(db, category_slug)
+        if category:
+            category_id = category.id
+    
+    # Continue from the cursor when the client has one, else fall back to the page offset
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = decode_course_cursor(cursor)
+        if after is None:
+            return {'detail': 'Invalid cursor'}, 400
+    
+    skip = 0 if after else (page - 1) * PER_PAGE
+    courses = get_catalog_page(db, skip=skip, limit=PER_PAGE + 1, category_id=category_id,
+                               search=search_query or None, after=after)
+    has_more = len(courses) > PER_PAGE
+    courses = courses[:PER_PAGE]
+    
+    courses_data = [_course_card(course) for course in courses]
+    
+    return {
+        'courses': courses_data,
+        'has_more': has_more,
+        'page': page,
+        'next_cursor': encode_course_cursor(courses[-1]) if has_more else None,
+    }
 
 
 @bp.route('/course')
 @bp.route('/course/<course_slug>')
 def course_overview(course_slug=None):
     """Course overview page"""
-    db = SessionLocal()
-    try:
-        user = get_current_user_from_session()
-        
-        if course_slug:
-            course = get_course_by_slug(db, course_slug, include_relations=True)
-        else:
-            # Get first course if no slug provided (fallback)
-            course = db.query(Course).options(
-                joinedload(Course.instructor),
-                joinedload(Course.category),
-                joinedload(Course.lessons)
-            ).first()
-        
-        if not course:
-            return render_template('course-overview.html', course=None, user=user)
-        
+    db = get_db()
+    user = get_current_user_from_session()
+    
+    enrollment = None
+    if course_slug:
+        # The course and the current user's enrollment in it, in one query
+        course, enrollment = get_course_and_enrollment(db, course_slug, user.id if user else None)
+    else:
+        # Get first course if no slug provided (fallback); lessons come from a
+        # separate IN query so the course row isn't repeated once per lesson
+        course = db.query(Course).options(
+            joinedload(Course.instructor),
+            joinedload(Course.category),
+            selectinload(Course.lessons)
+        ).first()
         # Check if current user is enrolled
-        enrollment = None
-        if user:
+        if course and user:
             enrollment = db.query(Enrollment).filter(
                 Enrollment.student_id == user.id,
                 Enrollment.course_id == course.id
             ).first()
-        
-        # Sort lessons by order
-        lessons = sorted(course.lessons, key=lambda l: l.order) if course.lessons else []
-        
-        return render_template('course-overview.html', 
-                             course=course, 
-                             lessons=lessons,
-                             enrollment=enrollment,
-                             user=user,
-                             format_duration=format_duration)
-    finally:
-        db.close()
+    
+    if not course:
+        return render_template('course-overview.html', course=None, user=user)
+    
+    # Lessons are loaded in order (the relationship orders by Lesson.order)
+    lessons = course.lessons
+    
+    return render_template('course-overview.html', 
+                         course=course, 
+                         lessons=lessons,
+                         enrollment=enrollment,
+                         user=user,
+                         format_duration=format_duration)
 
 
 @bp.route('/lesson')
-@bp.route('/lesson/<lesson_id>')
+@bp.route('/lesson/<uuid:lesson_id>')
 @auth_required
 def lesson(lesson_id=None):
     """Individual lesson page"""
-    db = SessionLocal()
-    try:
-        user = get_user_by_id(db, session['user_id'])
-        
-        course_slug = request.args.get('course')
-        current_lesson = None
-        
-        if lesson_id:
-            # Get specific lesson
-            current_lesson = get_lesson_by_id(db, lesson_id)
-        elif course_slug:
-            # Get first lesson of specified course
-            course = get_course_by_slug(db, course_slug)
-            if course:
-                current_lesson = db.query(Lesson).filter(
-                    Lesson.course_id == course.id
-                ).order_by(Lesson.order).first()
+    db = get_db()
+    user = get_current_user_from_session()
+    
+    course_slug = request.args.get('course')
+    course = None
+    current_lesson = None
+    
+    if lesson_id:
+        # Get specific lesson, along with its course and sidebar lessons
+        current_lesson = get_lesson_by_id(db, lesson_id, include_course=True)
+        if current_lesson:
+            course = current_lesson.course
+    else:
+        if course_slug:
+            # Specified course
+            course = get_course_by_slug(db, course_slug, include_relations=True)
         else:
-            # Get first lesson from first enrolled course
+            # First enrolled course
             enrollment = db.query(Enrollment).filter(
                 Enrollment.student_id == user.id
             ).first()
             if enrollment:
-                current_lesson = db.query(Lesson).filter(
-                    Lesson.course_id == enrollment.course_id
-                ).order_by(Lesson.order).first()
-        
-        if not current_lesson:
-            return render_template('lesson.html', lesson=None, course=None, lessons=[], user=user)
-        
-        # Get the course and all its lessons
-        course = get_course_by_id(db, current_lesson.course_id, include_relations=True)
-        
-        # Get ordered lessons for sidebar
-        lessons = sorted(course.lessons, key=lambda l: l.order) if course else []
-        
-        # Get enrollment and progress for current user
-        enrollment = db.query(Enrollment).filter(
-            Enrollment.student_id == user.id,
-            Enrollment.course_id == course.id
-        ).first()
-        
-        progress_map = {}
-        if enrollment:
-            # Update last accessed
-            enrollment.last_accessed = datetime.now()
+                course = get_course_by_id(db, enrollment.course_id, include_relations=True)
+        # Start at its first lesson (course.lessons is loaded in lesson order)
+        if course and course.lessons:
+            current_lesson = course.lessons[0]
+    
+    if not current_lesson:
+        return render_template('lesson.html', lesson=None, course=None, lessons=[], user=user)
+    
+    # Lessons for the sidebar, already in order
+    lessons = course.lessons
+    
+    # Get enrollment and progress for current user
+    enrollment = db.query(Enrollment).filter(
+        Enrollment.student_id == user.id,
+        Enrollment.course_id == course.id
+    ).first()
+    
+    completed_lesson_ids = set()
+    if enrollment:
+        # Update last accessed, at most once per LAST_ACCESSED_WRITE_INTERVAL while moving between lessons
+        now = datetime.now()
+        interval = timedelta(seconds=current_app.config['LAST_ACCESSED_WRITE_INTERVAL'])
+        if enrollment.last_accessed is None or now - enrollment.last_accessed > interval:
+            enrollment.last_accessed = now
             db.commit()
 
-            progress_records = get_progress_by_enrollment(db, enrollment.id)
-            progress_map = {str(p.lesson_id): p for p in progress_records}
-            
-            # Start tracking this lesson if not already
-            if str(current_lesson.id) not in progress_map:
-                create_lesson_progress(db, enrollment.id, current_lesson.id)
-                # Refresh map
-                progress_records = get_progress_by_enrollment(db, enrollment.id)
-                progress_map = {str(p.lesson_id): p for p in progress_records}
-
+        progress_rows = get_progress_rows(db, enrollment.id)
+        completed_lesson_ids = {row.lesson_id for row in progress_rows if row.is_completed}
         
-        # Calculate progress percentage
-        completed_count = sum(1 for p in progress_map.values() if p.is_completed)
-        total_lessons = len(lessons)
-        progress_percent = int((completed_count / total_lessons) * 100) if total_lessons > 0 else 0
-        
-        return render_template('lesson.html', 
-                             lesson=current_lesson, 
-                             course=course, 
-                             lessons=lessons,
-                             enrollment=enrollment,
-                             progress_map=progress_map,
-                             progress_percent=progress_percent,
-                             completed_count=completed_count,
-                             user=user,
-                             format_duration=format_duration)
-    finally:
-        db.close()
+        # Start tracking this lesson if not already
+        if all(row.lesson_id != current_lesson.id for row in progress_rows):
+            create_lesson_progress(db, enrollment.id, current_lesson.id)
+
+    
+    # Calculate progress percentage
+    completed_count = len(completed_lesson_ids)
+    total_lessons = len(lessons)
+    progress_percent = int((completed_count / total_lessons) * 100) if total_lessons > 0 else 0
+    
+    return render_template('lesson.html', 
+                         lesson=current_lesson, 
+                         course=course, 
+                         lessons=lessons,
+                         enrollment=enrollment,
+                         completed_lesson_ids=completed_lesson_ids,
+                         progress_percent=progress_percent,
+                         completed_count=completed_count,
+                         user=user,
+                         format_duration=format_duration)
 
 
 @bp.route('/api/enrollments', methods=['POST'])
+@api_auth_required
 def enroll_course():
     """API to enroll a student in a course"""
-    if 'user_id' not in session:
-        return {"detail": "Authentication required"}, 401
-        
-    db = SessionLocal()
+    db = get_db()
     try:
         data = request.get_json()
         course_id = data.get('course_id')
@@ -274,17 +270,15 @@ def enroll_course():
         
     except Exception as e:
         return {"detail": str(e)}, 500
-    finally:
-        db.close()
 
 
-@bp.route('/api/complete-lesson/<lesson_id>', methods=['POST'])
+@bp.route('/api/complete-lesson/<uuid:lesson_id>', methods=['POST'])
 def complete_lesson(lesson_id):
     """API to mark a lesson as complete"""
     if 'user_id' not in session:
         return {"success": False, "error": "Unauthorized"}, 401
         
-    db = SessionLocal()
+    db = get_db()
     try:
         user_id = session['user_id']
         
@@ -304,20 +298,11 @@ def complete_lesson(lesson_id):
              enrollment = create_enrollment(db, user_id, lesson.course_id)
 
         # Mark progress complete
-        progress = create_lesson_progress(db, enrollment.id, lesson_id)
-        update_lesson_progress(db, progress.id, is_completed=True)
+        complete_lesson_progress(db, enrollment.id, lesson_id)
         
         # Check course completion
-        lessons = get_lessons_by_course(db, lesson.course_id)
-        all_progress = get_progress_by_enrollment(db, enrollment.id)
-        
-        completed_lesson_ids = {str(p.lesson_id) for p in all_progress if p.is_completed}
-        
-        all_complete = True
-        for l in lessons:
-            if str(l.id) not in completed_lesson_ids:
-                all_complete = False
-                break
+        total_lessons, completed_count = get_completion_counts(db, enrollment.id, lesson.course_id)
+        all_complete = completed_count == total_lessons
         
         if all_complete:
             enrollment.completed_at = datetime.now()
@@ -339,5 +324,3 @@ def complete_lesson(lesson_id):
     except Exception as e:
         db.rollback()
         return {"success": False, "error": str(e)}, 500
-    finally:
-        db.close()
@@ -2,11 +2,19 @@
 Category management services
 """
 from datetime import datetime
+from types import SimpleNamespace
 from uuid import UUID
 from typing import Optional
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from app.models import Category
+from app.cache import TTLCache
+from app.config import Config
+
+# Read-only copies of the category list for the browse filter bar, plus the
+# same snapshots keyed by slug for the category filter. The CRUD functions
+# below clear it; the TTL covers rows written elsewhere (seeding)
+_category_cache = TTLCache(maxsize=2, ttl=Config.CATALOG_CACHE_TTL)
 
 def get_category_by_id(db: Session, category_id: UUID) -> Optional[Category]:
     """Get category by UUID"""
@@ -23,35 +31,62 @@ def get_all_categories(db: Session, skip: int = 0, limit: int = 100) -> list[typ
     return db.query(Category).offset(skip).limit(limit).all()
 
 
+def get_category_list(db: Session) -> tuple[SimpleNamespace, ...]:
+    """All categories as cached read-only snapshots (id, name, slug)"""
+    categories = _category_cache.get('all')
+    if categories is None:
+        categories = tuple(
+            SimpleNamespace(id=c.id, name=c.name, slug=c.slug)
+            for c in get_all_categories(db)
+        )
+        _category_cache.set('all', categories)
+    return categories
+
+
+def get_category_snapshot_by_slug(db: Session, slug: str) -> Optional[SimpleNamespace]:
+    """Category snapshot by slug, from the cached list (falling back to the database on a miss)"""
+    by_slug = _category_cache.get('by_slug')
+    if by_slug is None:
+        by_slug = {c.slug: c for c in get_category_list(db)}
+        _category_cache.set('by_slug', by_slug)
+    category = by_slug.get(slug)
+    if category is None:
+        row = get_category_by_slug(db, slug)
+        if row:
+            category = SimpleNamespace(id=row.id, name=row.name, slug=row.slug)
+    return category
+
+
 def create_category(db: Session, name: str, slug: str) -> Category:
     """Create a new category"""
     try:
         category = Category(name=name, slug=slug)
         db.add(category)
         db.commit()
-        db.refresh(category)
+        _category_cache.clear()
         return category
     except IntegrityError as e:
         db.rollback()
         raise ValueError("Category with this name or slug already exists") from e
 
 
+_UPDATABLE_FIELDS = frozenset({'name', 'slug'})
+
 def update_category(db: Session, category_id: UUID, **kwargs) -> Optional[Category]:
     """Update category by UUID"""
     category = get_category_by_id(db, category_id)
     if not category:
         return None
     
-    allowed_fields = ['name', 'slug']
     for field, value in kwargs.items():
-        if field in allowed_fields and value is not None:
+        if field in _UPDATABLE_FIELDS and value is not None:
             setattr(category, field, value)
     
     category.updated_at = datetime.now()
     
     try:
         db.commit()
-        db.refresh(category)
+        _category_cache.clear()
         return category
     except IntegrityError as e:
         db.rollback()
@@ -66,4 +101,5 @@ def delete_category(db: Session, category_id: UUID) -> bool:
     
     db.delete(category)
     db.commit()
+    _category_cache.clear()
     return True
@@ -2,21 +2,40 @@
 Course management services
 """
 from datetime import datetime
+from types import SimpleNamespace
 from uuid import UUID
 from typing import Optional
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import tuple_, delete, select, and_, func
+from sqlalchemy.orm import Session, joinedload, selectinload, load_only, with_expression
 from sqlalchemy.exc import IntegrityError
-from app.models import Course
+from app.models import Course, Enrollment, User, Category
+from app.db import LAZY_LOAD_GUARD
+from app.cache import TTLCache
+from app.config import Config
+
+# Scalar relations ride along in the JOIN; lessons come from one extra
+# SELECT ... WHERE course_id IN (...) instead of repeating the course row
+# (with its long description columns) once per lesson
+_COURSE_RELATIONS = (
+    joinedload(Course.instructor),
+    joinedload(Course.category),
+    selectinload(Course.lessons),
+    *LAZY_LOAD_GUARD,
+)
+
+# Cards fall back to this much of the description when there's no small_description
+_CARD_DESCRIPTION_LENGTH = 100
+
+# Read-only course card snapshots for the public catalog, keyed by the page
+# query. Course writes below clear it; the TTL covers category/instructor
+# renames and rows written elsewhere (seeding)
+_catalog_cache = TTLCache(maxsize=256, ttl=Config.CATALOG_CACHE_TTL)
 
 def get_course_by_id(db: Session, course_id: UUID, include_relations: bool = False) -> Optional[Course]:
     """Get course by UUID with optional nested relationships"""
     query = db.query(Course)
     if include_relations:
-        query = query.options(
-            joinedload(Course.instructor),
-            joinedload(Course.category),
-            joinedload(Course.lessons)
-        )
+        query = query.options(*_COURSE_RELATIONS)
     return query.filter(Course.id == course_id).first()
 
 
@@ -24,23 +43,62 @@ def get_course_by_slug(db: Session, slug: str, include_relations: bool = False)
     """Get course by slug with optional nested relationships"""
     query = db.query(Course)
     if include_relations:
-        query = query.options(
-            joinedload(Course.instructor),
-            joinedload(Course.category),
-            joinedload(Course.lessons)
-        )
+        query = query.options(*_COURSE_RELATIONS)
     return query.filter(Course.slug == slug).first()
 
 
+def get_course_and_enrollment(db: Session, slug: str,
+                              student_id: Optional[UUID]) -> tuple[Optional[Course], Optional[Enrollment]]:
+    """
+    Course by slug (with nested relationships) and the student's enrollment in
+    it (None if not enrolled), fetched together in one query
+    """
+    if student_id is None:
+        return get_course_by_slug(db, slug, include_relations=True), None
+    row = db.execute(
+        select(Course, Enrollment)
+        .outerjoin(Enrollment, and_(Enrollment.course_id == Course.id, Enrollment.student_id == student_id))
+        .options(*_COURSE_RELATIONS)
+        .where(Course.slug == slug)
+    ).first()
+    return (row.Course, row.Enrollment) if row else (None, None)
+
+
+def encode_course_cursor(course: Course) -> str:
+    """Keyset cursor pointing just past this course in catalog order"""
+    return f"{course.created_at.isoformat()}_{course.id}"
+
+
+def decode_course_cursor(cursor: str) -> Optional[tuple[datetime, UUID]]:
+    """Parse a cursor from encode_course_cursor (None if it is malformed)"""
+    created_at, _, course_id = cursor.rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), UUID(course_id)
+    except ValueError:
+        return None
+
+
 def get_all_courses(db: Session, skip: int = 0, limit: int = 100, 
                     category_id: Optional[UUID] = None,
                     instructor_id: Optional[UUID] = None,
                     difficulty_level: Optional[str] = None,
-                    search: Optional[str] = None) -> list[type[Course]]:
-    """Get all courses with optional filters"""
+                    search: Optional[str] = None,
+                    after: Optional[tuple[datetime, UUID]] = None) -> list[type[Course]]:
+    """
+    Get all courses with optional filters, in (created_at, id) order.
+    Pass `after` (see decode_course_cursor) instead of `skip` to page by
+    keyset, which stays cheap however deep the page is.
+    """
     query = db.query(Course).options(
-        joinedload(Course.instructor),
-        joinedload(Course.category)
+        # Only what a catalog card shows: skips the long-form course text and
+        # array columns (cards get just the start of the description), and the
+        # instructor's password hash and bio
+        load_only(Course.title, Course.slug, Course.thumbnail, Course.rating, Course.duration_hours,
+                  Course.small_description, Course.created_at),
+        with_expression(Course.description_preview, func.left(Course.description, _CARD_DESCRIPTION_LENGTH)),
+        joinedload(Course.instructor).load_only(User.full_name, User.profile_image),
+        joinedload(Course.category).load_only(Category.name),
+        *LAZY_LOAD_GUARD
     )
     
     if category_id:
@@ -52,7 +110,6 @@ def get_all_courses(db: Session, skip: int = 0, limit: int = 100,
     if search:
         search_term = f"%{search}%"
         from sqlalchemy import or_
-        from app.models import User
         query = query.join(Course.instructor).filter(
             or_(
                 Course.title.ilike(search_term),
@@ -62,9 +119,50 @@ def get_all_courses(db: Session, skip: int = 0, limit: int = 100,
             )
         )
     
+    if after:
+        query = query.filter(tuple_(Course.created_at, Course.id) > after)
+    
+    query = query.order_by(Course.created_at, Course.id)
     return query.offset(skip).limit(limit).all()
 
 
+def _snapshot_course_card(course: Course) -> SimpleNamespace:
+    """The fields a catalog card (and its cursor) reads, detached from the session"""
+    return SimpleNamespace(
+        id=course.id,
+        slug=course.slug,
+        title=course.title,
+        thumbnail=course.thumbnail,
+        rating=course.rating,
+        duration_hours=course.duration_hours,
+        small_description=course.small_description,
+        description=course.description_preview,
+        created_at=course.created_at,
+        category=SimpleNamespace(name=course.category.name) if course.category else None,
+        instructor=SimpleNamespace(
+            full_name=course.instructor.full_name,
+            profile_image=course.instructor.profile_image,
+        ) if course.instructor else None,
+    )
+
+
+def get_catalog_page(db: Session, skip: int = 0, limit: int = 100,
+                     category_id: Optional[UUID] = None,
+                     search: Optional[str] = None,
+                     after: Optional[tuple[datetime, UUID]] = None) -> tuple[SimpleNamespace, ...]:
+    """A page of get_all_courses as cached read-only course card snapshots"""
+    key = (skip, limit, category_id, search, after)
+    courses = _catalog_cache.get(key)
+    if courses is None:
+        courses = tuple(
+            _snapshot_course_card(course)
+            for course in get_all_courses(db, skip=skip, limit=limit, category_id=category_id,
+                                          search=search, after=after)
+        )
+        _catalog_cache.set(key, courses)
+    return courses
+
+
 def create_course(db: Session, instructor_id: UUID, category_id: UUID, 
                  title: str, slug: str, **kwargs) -> Course:
     """Create a new course"""
@@ -78,35 +176,35 @@ def create_course(db: Session, instructor_id: UUID, category_id: UUID,
         )
         db.add(course)
         db.commit()
-        db.refresh(course)
+        _catalog_cache.clear()
         return course
     except IntegrityError as e:
         db.rollback()
         raise ValueError("Course with this slug already exists") from e
 
 
+_UPDATABLE_FIELDS = frozenset({
+    'title', 'slug', 'small_description', 'description', 'thumbnail',
+    'duration_hours', 'difficulty_level', 'rating', 'course_purpose',
+    'learning_objectives', 'topics_covered', 'instructor_id', 'category_id',
+    'published_at'
+})
+
 def update_course(db: Session, course_id: UUID, **kwargs) -> Optional[Course]:
     """Update course by UUID"""
     course = get_course_by_id(db, course_id)
     if not course:
         return None
     
-    allowed_fields = [
-        'title', 'slug', 'small_description', 'description', 'thumbnail',
-        'duration_hours', 'difficulty_level', 'rating', 'course_purpose',
-        'learning_objectives', 'topics_covered', 'instructor_id', 'category_id',
-        'published_at'
-    ]
-    
     for field, value in kwargs.items():
-        if field in allowed_fields and value is not None:
+        if field in _UPDATABLE_FIELDS and value is not None:
             setattr(course, field, value)
     
     course.updated_at = datetime.now()
     
     try:
         db.commit()
-        db.refresh(course)
+        _catalog_cache.clear()
         return course
     except IntegrityError as e:
         db.rollback()
@@ -114,11 +212,8 @@ def update_course(db: Session, course_id: UUID, **kwargs) -> Optional[Course]:
 
 
 def delete_course(db: Session, course_id: UUID) -> bool:
-    """Delete course by UUID (cascades to lessons and enrollments)"""
-    course = get_course_by_id(db, course_id)
-    if not course:
-        return False
-    
-    db.delete(course)
+    """Delete course by UUID (the database cascades to lessons, enrollments and progress)"""
+    result = db.execute(delete(Course).where(Course.id == course_id))
     db.commit()
-    return True
+    _catalog_cache.clear()
+    return result.rowcount > 0
@@ -4,24 +4,77 @@ Enrollment management services
 from datetime import datetime
 from uuid import UUID
 from typing import Optional
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
-from app.models import Enrollment, Course
+from app.models import Enrollment, Course, Lesson, LessonProgress
+from app.db import LAZY_LOAD_GUARD
 
 def get_enrollment_by_id(db: Session, enrollment_id: UUID) -> Optional[Enrollment]:
     """Get enrollment by UUID"""
     return db.query(Enrollment).options(
         joinedload(Enrollment.course).joinedload(Course.instructor),
-        joinedload(Enrollment.course).joinedload(Course.category)
+        joinedload(Enrollment.course).joinedload(Course.category),
+        *LAZY_LOAD_GUARD
     ).filter(Enrollment.id == enrollment_id).first()
 
 
-def get_enrollments_by_student(db: Session, student_id: UUID) -> list[type[Enrollment]]:
-    """Get all enrollments for a student"""
-    return db.query(Enrollment).options(
+def get_enrollments_by_student(db: Session, student_id: UUID,
+                               completed: Optional[bool] = None) -> list[type[Enrollment]]:
+    """
+    Get a student's enrollments with their course, instructor and category
+    loaded up front. completed=True/False keeps only finished/active ones.
+    """
+    query = db.query(Enrollment).options(
         joinedload(Enrollment.course).joinedload(Course.instructor),
-        joinedload(Enrollment.course).joinedload(Course.category)
-    ).filter(Enrollment.student_id == student_id).all()
+        joinedload(Enrollment.course).joinedload(Course.category),
+        *LAZY_LOAD_GUARD
+    )
+    
+    query = query.filter(Enrollment.student_id == student_id)
+    if completed is True:
+        query = query.filter(Enrollment.completed_at.isnot(None))
+    elif completed is False:
+        query = query.filter(Enrollment.completed_at.is_(None))
+    return query.all()
+
+
+def count_enrollments_by_student(db: Session, student_id: UUID) -> tuple[int, int]:
+    """(enrolled, completed) course counts for a student, from one aggregate query"""
+    return tuple(db.execute(
+        select(func.count(), func.count().filter(Enrollment.completed_at.isnot(None)))
+        .select_from(Enrollment)
+        .where(Enrollment.student_id == student_id)
+    ).one())
+
+
+def get_enrollment_summaries(db: Session, student_id: UUID) -> list:
+    """
+    One row per enrollment of a student with its course title/slug and
+    total/completed lesson counts, computed by the database in a single query
+    """
+    total_lessons = (
+        select(func.count(Lesson.id))
+        .where(Lesson.course_id == Enrollment.course_id)
+        .correlate(Enrollment)
+        .scalar_subquery()
+    )
+    completed_lessons = (
+        select(func.count(LessonProgress.id))
+        .where(LessonProgress.enrollment_id == Enrollment.id, LessonProgress.is_completed.is_(True))
+        .correlate(Enrollment)
+        .scalar_subquery()
+    )
+    return db.execute(
+        select(
+            Enrollment.id, Enrollment.course_id, Course.title, Course.slug,
+            Enrollment.enrolled_at, Enrollment.completed_at, Enrollment.last_accessed,
+            total_lessons.label('total_lessons'), completed_lessons.label('completed_lessons')
+        )
+        .join(Course, Course.id == Enrollment.course_id)
+        .where(Enrollment.student_id == student_id)
+        .order_by(Enrollment.enrolled_at.desc())
+    ).all()
 
 
 def get_enrollments_by_course(db: Session, course_id: UUID) -> list[type[Enrollment]]:
@@ -36,56 +89,48 @@ def get_all_enrollments(db: Session, skip: int = 0, limit: int = 100) -> list[ty
 
 def create_enrollment(db: Session, student_id: UUID, course_id: UUID) -> Enrollment:
     """Create a new enrollment"""
-    # Check if already enrolled
-    existing = db.query(Enrollment).filter(
-        Enrollment.student_id == student_id,
-        Enrollment.course_id == course_id
-    ).first()
-    
-    if existing:
-        raise ValueError("Student is already enrolled in this course")
-    
+    # No pre-check: the uq_student_course constraint rejects a second enrollment
     try:
         enrollment = Enrollment(student_id=student_id, course_id=course_id)
         db.add(enrollment)
         db.commit()
-        db.refresh(enrollment)
         return enrollment
     except IntegrityError as e:
         db.rollback()
+        if 'uq_student_course' in str(e.orig):
+            raise ValueError("Student is already enrolled in this course") from e
         raise ValueError("Failed to create enrollment") from e
 
 
 def update_enrollment_access(db: Session, enrollment_id: UUID) -> Optional[Enrollment]:
-    """Update enrollment's last_accessed timestamp"""
-    enrollment = get_enrollment_by_id(db, enrollment_id)
-    if not enrollment:
-        return None
-    
-    enrollment.last_accessed = datetime.now()
+    """Update enrollment's last_accessed timestamp (one UPDATE ... RETURNING)"""
+    enrollment = db.execute(
+        update(Enrollment)
+        .where(Enrollment.id == enrollment_id)
+        .values(last_accessed=datetime.now())
+        .returning(Enrollment)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(enrollment)
     return enrollment
 
 
 def complete_enrollment(db: Session, enrollment_id: UUID) -> Optional[Enrollment]:
-    """Mark enrollment as completed"""
-    enrollment = get_enrollment_by_id(db, enrollment_id)
-    if not enrollment:
-        return None
-    
-    enrollment.completed_at = datetime.now()
+    """Mark enrollment as completed (one UPDATE ... RETURNING)"""
+    enrollment = db.execute(
+        update(Enrollment)
+        .where(Enrollment.id == enrollment_id)
+        .values(completed_at=datetime.now())
+        .returning(Enrollment)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(enrollment)
     return enrollment
 
 
 def delete_enrollment(db: Session, enrollment_id: UUID) -> bool:
-    """Delete enrollment by UUID (unenroll)"""
-    enrollment = get_enrollment_by_id(db, enrollment_id)
-    if not enrollment:
-        return False
-    
-    db.delete(enrollment)
+    """
+    Delete enrollment by UUID (unenroll) in a single DELETE; the database
+    cascades to its lesson progress.
+    """
+    result = db.execute(delete(Enrollment).where(Enrollment.id == enrollment_id))
     db.commit()
-    return True
+    return result.rowcount > 0
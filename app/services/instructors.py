@@ -33,27 +33,26 @@ def create_instructor(db: Session, full_name: str, email: str, password: str,
         instructor.set_password(password)
         db.add(instructor)
         db.commit()
-        db.refresh(instructor)
         return instructor
     except IntegrityError as e:
         db.rollback()
         raise ValueError("Failed to create instructor") from e
 
 
+_UPDATABLE_FIELDS = frozenset({'full_name', 'designation', 'profile_image', 'bio', 'email'})
+
 def update_instructor(db: Session, instructor_id: UUID, **kwargs) -> Optional[User]:
     """Update instructor by UUID"""
     instructor = get_instructor_by_id(db, instructor_id)
     if not instructor:
         return None
     
-    allowed_fields = ['full_name', 'designation', 'profile_image', 'bio', 'email']
     for field, value in kwargs.items():
-        if field in allowed_fields and value is not None:
+        if field in _UPDATABLE_FIELDS and value is not None:
             setattr(instructor, field, value)
     
     instructor.updated_at = datetime.now()
     db.commit()
-    db.refresh(instructor)
     return instructor
 
 
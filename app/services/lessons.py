@@ -4,13 +4,25 @@ Lesson management services
 from datetime import datetime
 from uuid import UUID
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import delete
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.exc import IntegrityError
-from app.models import Lesson
+from app.models import Lesson, Course
+from app.db import LAZY_LOAD_GUARD
 
-def get_lesson_by_id(db: Session, lesson_id: UUID) -> Optional[Lesson]:
-    """Get lesson by UUID"""
-    return db.query(Lesson).filter(Lesson.id == lesson_id).first()
+def get_lesson_by_id(db: Session, lesson_id: UUID, include_course: bool = False) -> Optional[Lesson]:
+    """
+    Get lesson by UUID. include_course also loads its course (with instructor,
+    category and the ordered lesson list) so a lesson page needs no follow-up queries
+    """
+    query = db.query(Lesson)
+    if include_course:
+        query = query.options(joinedload(Lesson.course).options(
+            joinedload(Course.instructor),
+            joinedload(Course.category),
+            selectinload(Course.lessons),
+        ), *LAZY_LOAD_GUARD)
+    return query.filter(Lesson.id == lesson_id).first()
 
 
 def get_lessons_by_course(db: Session, course_id: UUID) -> list[type[Lesson]]:
@@ -29,36 +41,31 @@ def create_lesson(db: Session, course_id: UUID, title: str, order: int, **kwargs
         lesson = Lesson(course_id=course_id, title=title, order=order, **kwargs)
         db.add(lesson)
         db.commit()
-        db.refresh(lesson)
         return lesson
     except IntegrityError as e:
         db.rollback()
         raise ValueError("Failed to create lesson") from e
 
 
+_UPDATABLE_FIELDS = frozenset({'title', 'order', 'description', 'video_duration', 'video_url'})
+
 def update_lesson(db: Session, lesson_id: UUID, **kwargs) -> Optional[Lesson]:
     """Update lesson by UUID"""
     lesson = get_lesson_by_id(db, lesson_id)
     if not lesson:
         return None
     
-    allowed_fields = ['title', 'order', 'description', 'video_duration', 'video_url']
     for field, value in kwargs.items():
-        if field in allowed_fields and value is not None:
+        if field in _UPDATABLE_FIELDS and value is not None:
             setattr(lesson, field, value)
     
     lesson.updated_at = datetime.now()
     db.commit()
-    db.refresh(lesson)
     return lesson
 
 
 def delete_lesson(db: Session, lesson_id: UUID) -> bool:
-    """Delete lesson by UUID"""
-    lesson = get_lesson_by_id(db, lesson_id)
-    if not lesson:
-        return False
-    
-    db.delete(lesson)
+    """Delete lesson by UUID (the database cascades to its progress rows)"""
+    result = db.execute(delete(Lesson).where(Lesson.id == lesson_id))
     db.commit()
-    return True
+    return result.rowcount > 0
@@ -4,9 +4,12 @@ Lesson Progress management services
 from datetime import datetime
 from uuid import UUID
 from typing import Optional
+from sqlalchemy import select, func, and_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
-from app.models import LessonProgress
+from app.models import LessonProgress, Lesson
+from app.db import LAZY_LOAD_GUARD
 
 def get_lesson_progress_by_id(db: Session, progress_id: UUID) -> Optional[LessonProgress]:
     """Get lesson progress by UUID"""
@@ -18,10 +21,33 @@ def get_lesson_progress_by_id(db: Session, progress_id: UUID) -> Optional[Lesson
 def get_progress_by_enrollment(db: Session, enrollment_id: UUID) -> list[type[LessonProgress]]:
     """Get all lesson progress records for an enrollment"""
     return db.query(LessonProgress).options(
-        joinedload(LessonProgress.lesson)
+        joinedload(LessonProgress.lesson),
+        *LAZY_LOAD_GUARD
     ).filter(LessonProgress.enrollment_id == enrollment_id).all()
 
 
+def get_progress_rows(db: Session, enrollment_id: UUID) -> list:
+    """(lesson_id, is_completed) rows for an enrollment, without loading ORM objects"""
+    return db.execute(
+        select(LessonProgress.lesson_id, LessonProgress.is_completed)
+        .where(LessonProgress.enrollment_id == enrollment_id)
+    ).all()
+
+
+def get_completion_counts(db: Session, enrollment_id: UUID, course_id: UUID) -> tuple[int, int]:
+    """(total, completed) lessons of a course for an enrollment, counted in one aggregate query"""
+    return tuple(db.execute(
+        select(func.count(Lesson.id.distinct()), func.count(LessonProgress.lesson_id.distinct()))
+        .select_from(Lesson)
+        .outerjoin(LessonProgress, and_(
+            LessonProgress.lesson_id == Lesson.id,
+            LessonProgress.enrollment_id == enrollment_id,
+            LessonProgress.is_completed.is_(True)
+        ))
+        .where(Lesson.course_id == course_id)
+    ).one())
+
+
 def get_progress_by_enrollment_and_lesson(db: Session, enrollment_id: UUID, 
                                           lesson_id: UUID) -> Optional[LessonProgress]:
     """Get specific lesson progress for an enrollment"""
@@ -47,13 +73,42 @@ def create_lesson_progress(db: Session, enrollment_id: UUID, lesson_id: UUID) ->
         )
         db.add(progress)
         db.commit()
-        db.refresh(progress)
         return progress
     except IntegrityError as e:
         db.rollback()
+        # Another request created it first
+        existing = get_progress_by_enrollment_and_lesson(db, enrollment_id, lesson_id)
+        if existing:
+            return existing
         raise ValueError("Failed to create lesson progress") from e
 
 
+def complete_lesson_progress(db: Session, enrollment_id: UUID, lesson_id: UUID) -> None:
+    """
+    Mark a lesson completed for an enrollment, creating its progress row if
+    needed, in a single INSERT ... ON CONFLICT DO UPDATE
+    """
+    now = datetime.now()
+    stmt = insert(LessonProgress).values(
+        enrollment_id=enrollment_id,
+        lesson_id=lesson_id,
+        is_completed=True,
+        started_at=now,
+        completed_at=now,
+        last_accessed=now
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[LessonProgress.enrollment_id, LessonProgress.lesson_id],
+        set_={
+            'is_completed': True,
+            'last_accessed': now,
+            # Keep the first completion time
+            'completed_at': func.coalesce(LessonProgress.completed_at, stmt.excluded.completed_at),
+        }
+    ))
+    db.commit()
+
+
 def update_lesson_progress(db: Session, progress_id: UUID, is_completed: bool = False) -> Optional[LessonProgress]:
     """Update lesson progress"""
     progress = get_lesson_progress_by_id(db, progress_id)
@@ -67,5 +122,4 @@ def update_lesson_progress(db: Session, progress_id: UUID, is_completed: bool =
         progress.completed_at = datetime.now()
     
     db.commit()
-    db.refresh(progress)
     return progress
@@ -1,22 +1,37 @@
 """
 User management services
 """
-from datetime import datetime
+import os
+import re
+import time
+from datetime import datetime, timedelta
 from uuid import UUID
 from typing import Optional
+from flask import current_app
+from sqlalchemy import select, literal, update, delete
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from app.models import User, UserRole
+from app.models import User, UserRole, hash_password, check_dummy_password
+from app.config import Config
 
 def get_user_by_id(db: Session, user_id: UUID) -> Optional[User]:
-    """Get user by UUID"""
-    return db.query(User).filter(User.id == user_id).first()
+    """Get user by UUID (answered from the session's identity map when already loaded)"""
+    try:
+        user_id = user_id if isinstance(user_id, UUID) else UUID(str(user_id))
+    except ValueError:
+        return None
+    return db.get(User, user_id)
 
 
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     """Get user by email"""
     return db.query(User).filter(User.email == email).first()
 
+
+def user_email_exists(db: Session, email: str) -> bool:
+    """Check whether an email is registered without loading the user row"""
+    return db.execute(select(literal(1)).where(User.email == email).limit(1)).first() is not None
+
 def get_all_users(db: Session, skip: int = 0, limit: int = 100, role: Optional[str] = None) -> list[type[User]]:
     """Get all users with optional filtering"""
     query = db.query(User)
@@ -48,7 +63,6 @@ def create_user(db: Session, email: str, password: str, full_name: str,
         # Add to database
         db.add(user)
         db.commit()
-        db.refresh(user)
         
         return user
     except IntegrityError as e:
@@ -61,50 +75,92 @@ def _delete_profile_image_file(image_url: str) -> None:
     if not image_url or 'default-user.svg' in image_url:
         return
 
-    from pathlib import Path
-    import os
     try:
         # Extract filename from URL path
         old_filename = os.path.basename(image_url)
         
         # Build path to the file
-        upload_dir = Path(__file__).parent.parent.parent / 'static' / 'uploads' / 'profile_photos'
-        old_file_path = upload_dir / old_filename
+        old_file_path = current_app.config['UPLOAD_FOLDER'] / old_filename
         
-        # Delete file if it exists
-        if old_file_path.exists():
-            old_file_path.unlink()
-            print(f"Deleted profile photo: {old_filename}")
+        # Delete file (already gone is fine, and nothing to report)
+        old_file_path.unlink()
+        current_app.logger.info("Deleted profile photo: %s", old_filename)
+    except FileNotFoundError:
+        return
     except Exception as e:
-        print(f"Failed to delete profile photo: {e}")
+        current_app.logger.warning("Failed to delete profile photo: %s", e)
+
+
+def _sweep_retired_profile_images(user_id: UUID, current_url: Optional[str]) -> None:
+    """
+    Delete a user's photos other than current_url once they have been
+    unreferenced for USER_CACHE_TTL seconds (a retired file's mtime records
+    when it stopped being used)
+    """
+    keep = os.path.basename(current_url) if current_url else None
+    cutoff = time.time() - Config.USER_CACHE_TTL
+    for path in current_app.config['UPLOAD_FOLDER'].glob(f"{user_id}_*"):
+        try:
+            if path.name != keep and path.stat().st_mtime < cutoff:
+                _delete_profile_image_file(path.name)
+        except FileNotFoundError:
+            continue
+
+
+def _retire_profile_image_file(user_id: UUID, image_url: str, current_url: Optional[str]) -> None:
+    """
+    Mark a replaced or removed profile photo as unreferenced and sweep the user's older ones.
+
+    Other workers may keep rendering the old URL from their cached user
+    snapshot for up to USER_CACHE_TTL seconds, so the file just retired is
+    only touched here and removed by a later sweep (on the user's next
+    update or login) once that window has passed.
+    """
+    if image_url and 'default-user.svg' not in image_url:
+        try:
+            os.utime(current_app.config['UPLOAD_FOLDER'] / os.path.basename(image_url))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            current_app.logger.warning("Failed to mark profile photo: %s", e)
+    _sweep_retired_profile_images(user_id, current_url)
 
 
+_UPDATABLE_FIELDS = frozenset({'full_name', 'bio', 'profile_image', 'major'})
+
 def update_user(db: Session, user_id: UUID, **kwargs) -> Optional[User]:
     """Update user by UUID"""
-    user = get_user_by_id(db, user_id)
-    if not user:
-        return None
+    fields = {field: value for field, value in kwargs.items() if field in _UPDATABLE_FIELDS}
 
-    # Update allowed fields
-    allowed_fields = ['full_name', 'bio', 'profile_image', 'major']
-
-    for field, value in kwargs.items():
-        if field in allowed_fields:
-            # Special handling for profile_image removal or update
-            if field == 'profile_image':
-                # If value is None, we are removing the image.
-                # If value is different from current, we are updating.
-                # In both cases, if there was an old image, delete it.
-                if user.profile_image and user.profile_image != value:
-                    _delete_profile_image_file(user.profile_image)
-            
+    try:
+        if 'profile_image' not in fields:
+            # No old photo to clean up, so the current row isn't needed: one UPDATE ... RETURNING
+            user = db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(**fields, updated_at=datetime.now())
+                .returning(User)
+            ).scalar_one_or_none()
+            db.commit()
+            if user:
+                _sweep_retired_profile_images(user.id, user.profile_image)
+            return user
+
+        user = get_user_by_id(db, user_id)
+        if not user:
+            return None
+
+        old_image = user.profile_image
+        for field, value in fields.items():
             setattr(user, field, value)
+        user.updated_at = datetime.now()
 
-    user.updated_at = datetime.now()
-
-    try:
         db.commit()
-        db.refresh(user)
+        # If the image was removed (None) or replaced, retire the old file once the change is saved
+        if old_image and old_image != user.profile_image:
+            _retire_profile_image_file(user.id, old_image, user.profile_image)
+        else:
+            _sweep_retired_profile_images(user.id, user.profile_image)
         return user
     except IntegrityError as e:
         db.rollback()
@@ -112,43 +168,46 @@ def update_user(db: Session, user_id: UUID, **kwargs) -> Optional[User]:
 
 
 def delete_user(db: Session, user_id: UUID) -> bool:
-    """Delete user by UUID"""
-    user = get_user_by_id(db, user_id)
-    if not user:
+    """Delete user by UUID (the database cascades to enrollments and progress)"""
+    deleted = db.execute(
+        delete(User).where(User.id == user_id).returning(User.profile_image)
+    ).first()
+    db.commit()
+    if deleted is None:
         return False
 
-    # Delete user's profile photo if it exists
-    if user.profile_image:
-        _delete_profile_image_file(user.profile_image)
-
-    db.delete(user)
-    db.commit()
+    # Delete the user's profile photo along with any retired ones still on disk
+    for path in current_app.config['UPLOAD_FOLDER'].glob(f"{user_id}_*"):
+        _delete_profile_image_file(path.name)
     return True
 
-def update_last_login(db: Session, user_id: UUID) -> Optional[User]:
-    """Update user's last login timestamp and set is_active to True"""
-    user = get_user_by_id(db, user_id)
-    if not user:
-        return None
-
-    utcnow = datetime.now()
-    user.last_login = utcnow
-    user.is_active = True  # Reactivate user on login
+def update_last_login(db: Session, user_id: UUID, password_hash: Optional[str] = None) -> Optional[User]:
+    """
+    Update user's last login timestamp and set is_active to True (and store
+    password_hash, when given). One UPDATE ... RETURNING round trip.
+    """
+    values = {'last_login': datetime.now(), 'is_active': True}  # Reactivate user on login
+    if password_hash is not None:
+        values['password_hash'] = password_hash
+    user = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(User)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(user)
     return user
 
 
 def deactivate_user(db: Session, user_id: UUID) -> Optional[User]:
-    """Set user's is_active to False when they log out"""
-    user = get_user_by_id(db, user_id)
-    if not user:
-        return None
-
-    user.is_active = False
-    user.updated_at = datetime.now()
+    """Set user's is_active to False when they log out (one UPDATE ... RETURNING)"""
+    user = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(is_active=False, updated_at=datetime.now())
+        .returning(User)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(user)
     return user
 
 
@@ -156,6 +215,8 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password"""
     user = get_user_by_email(db, email)
     if not user:
+        # Hash anyway, so an unknown email takes as long as a wrong password
+        check_dummy_password(password)
         return None
     
     if not user.check_password(password):
@@ -164,6 +225,30 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     return user
 
 
+def authenticate_and_touch(db: Session, email: str, password: str) -> Optional[User]:
+    """Authenticate a user and record the login in the same transaction"""
+    user = authenticate_user(db, email, password)
+    if not user:
+        return None
+    # Clean up photos retired since the user's last update, even if they never edit again
+    _sweep_retired_profile_images(user.id, user.profile_image)
+    # Re-hash with the current PASSWORD_HASH_METHOD while the plaintext is at hand,
+    # so changing the method or its cost applies to existing users as they log in
+    password_hash = hash_password(password) if user.password_needs_rehash() else None
+    # Already active and logged in moments ago: nothing worth writing
+    recent = datetime.now() - timedelta(seconds=Config.LAST_LOGIN_WRITE_INTERVAL)
+    if password_hash is None and user.is_active and user.last_login and user.last_login > recent:
+        return user
+    return update_last_login(db, user.id, password_hash)
+
+
+_PASSWORD_RULES = (
+    (re.compile(r'[A-Z]'), "Password must include at least one uppercase letter"),
+    (re.compile(r'[a-z]'), "Password must include at least one lowercase letter"),
+    (re.compile(r'[0-9]'), "Password must include at least one number"),
+    (re.compile(r'[!@#$%^&*(),.?":{}|<>]'), "Password must include at least one special character"),
+)
+
 def validate_password_strength(password: str) -> tuple[bool, str]:
     """
     Validate password meets strength requirements:
@@ -174,22 +259,12 @@ def validate_password_strength(password: str) -> tuple[bool, str]:
     
     Returns: (is_valid, error_message)
     """
-    import re
-    
     if len(password) < 8:
         return False, "Password must be at least 8 characters long"
     
-    if not re.search(r'[A-Z]', password):
-        return False, "Password must include at least one uppercase letter"
-    
-    if not re.search(r'[a-z]', password):
-        return False, "Password must include at least one lowercase letter"
-    
-    if not re.search(r'[0-9]', password):
-        return False, "Password must include at least one number"
-    
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-        return False, "Password must include at least one special character"
+    for pattern, error_msg in _PASSWORD_RULES:
+        if not pattern.search(password):
+            return False, error_msg
     
     return True, ""
 
@@ -213,5 +288,4 @@ def reset_user_password(db: Session, email: str, new_password: str) -> Optional[
     user.updated_at = datetime.now()
     
     db.commit()
-    db.refresh(user)
     return user
@@ -0,0 +1,36 @@
+"""
+Session cookie handling
+"""
+from itsdangerous import URLSafeTimedSerializer
+from flask.sessions import SecureCookieSessionInterface
+
+
+class CachedSecureCookieSessionInterface(SecureCookieSessionInterface):
+    """Signed cookie sessions that reuse one serializer per set of secret keys.
+
+    Flask builds a new URLSafeTimedSerializer on every request (once to open
+    the session and again to save it); the keys don't change at runtime, so
+    build it once and reuse it.
+    """
+
+    def __init__(self):
+        self._serializers = {}
+
+    def get_signing_serializer(self, app):
+        if not app.secret_key:
+            return None
+
+        keys = (*(app.config['SECRET_KEY_FALLBACKS'] or ()), app.secret_key)
+        serializer = self._serializers.get(keys)
+        if serializer is None:
+            serializer = URLSafeTimedSerializer(
+                list(keys),  # itsdangerous expects current key at top
+                salt=self.salt,
+                serializer=self.serializer,
+                signer_kwargs={
+                    'key_derivation': self.key_derivation,
+                    'digest_method': self.digest_method,
+                },
+            )
+            self._serializers[keys] = serializer
+        return serializer
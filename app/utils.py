@@ -1,12 +1,68 @@
+import os
+import hashlib
+import tempfile
 from functools import wraps
-from flask import session, redirect, url_for
-from app.db import SessionLocal
+from types import SimpleNamespace
+from flask import g, session, redirect, url_for
+from sqlalchemy import inspect
+from app.db import get_db
+from app.models import User
 from app.services import get_user_by_id
 from app.config import Config
+from app.cache import TTLCache
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+# Cached user snapshots keyed by user_id, so the navbar/context processor
+# doesn't hit the database on every render. Each worker process has its own
+# cache and invalidate_cached_user only clears the local one, so other workers
+# can show a user's old name/photo for up to USER_CACHE_TTL seconds after an
+# edit (replaced photos are kept on disk at least that long, see update_user)
+_user_cache = TTLCache(maxsize=Config.USER_CACHE_MAX, ttl=Config.USER_CACHE_TTL)
+# Read once at import: os.umask can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_USER_FIELDS = tuple(attr.key for attr in inspect(User).column_attrs if attr.key != 'password_hash')
+
+def file_extension(filename):
+    """Lower-cased extension of filename without the dot ('' if there is none)"""
+    return filename.rpartition('.')[2].lower() if '.' in filename else ''
+
+def allowed_file(filename, mimetype=None):
+    """Check the upload's extension (and MIME type, when given) against the allowlists"""
+    if file_extension(filename) not in Config.ALLOWED_EXTENSIONS:
+        return False
+    return mimetype is None or mimetype in Config.ALLOWED_IMAGE_MIMETYPES
+
+def save_upload(file, directory, prefix, ext, max_size, chunk_size=1 << 20):
+    """Copy an uploaded file (already parsed by werkzeug) to disk in chunks, named by its content hash.
+
+    The file is stored as '{prefix}{digest}.{ext}', so uploading the same
+    image again reuses the existing name instead of adding a copy. Returns
+    the filename, or None (leaving nothing on disk) as soon as more than
+    max_size bytes have been read, without copying the rest to disk.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    written = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while chunk := file.stream.read(chunk_size):
+                written += len(chunk)
+                if written > max_size:
+                    return None
+                digest.update(chunk)
+                out.write(chunk)
+            # mkstemp creates the file 0600; give it the usual umask permissions
+            # so a web server running as another user can serve it
+            os.fchmod(out.fileno(), 0o666 & ~_UMASK)
+
+        filename = f"{prefix}{digest.hexdigest()}.{ext}"
+        # Same name means same bytes, so replacing an existing copy is harmless, and it
+        # gives a reused (possibly retired) file a fresh mtime so a photo sweep keeps it
+        os.replace(tmp_path, os.path.join(directory, filename))
+        return filename
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def format_duration(hours):
     """Convert hours to 'Xh Ym' format"""
@@ -18,15 +74,39 @@ def format_duration(hours):
         return f"{h}h {m}m"
     return f"{h}h"
 
+def _snapshot_user(user):
+    """Detached, read-only copy of a user's columns (without the password hash)"""
+    return SimpleNamespace(**{field: getattr(user, field) for field in _USER_FIELDS})
+
+def user_to_dict(user, fields=('id', 'email', 'full_name', 'role', 'profile_image', 'bio', 'major', 'created_at')):
+    """Dict of a user's public profile fields (orjson serializes the UUID and datetime natively)"""
+    return {field: getattr(user, field) for field in fields}
+
+def invalidate_cached_user(user_id):
+    """Drop a user from the session cache after their row changes"""
+    _user_cache.pop(str(user_id))
+    g.pop('current_user', None)
+
 def get_current_user_from_session():
-    """Get the currently logged-in user from session"""
+    """Get the currently logged-in user from session (cached read-only snapshot)"""
     user_id = session.get('user_id')
     if user_id:
-        db = SessionLocal()
-        try:
-            return get_user_by_id(db, user_id)
-        finally:
-            db.close()
+        # auth_required, the view and the context processor all ask; resolve once per request
+        user = g.get('current_user')
+        if user is not None and str(user.id) == user_id:
+            return user
+        user = _user_cache.get(user_id)
+        if user is not None:
+            g.current_user = user
+            return user
+        db = get_db()
+        db_user = get_user_by_id(db, user_id)
+        if db_user is None:
+            return None
+        user = _snapshot_user(db_user)
+        _user_cache.set(user_id, user)
+        g.current_user = user
+        return user
     return None
 
 def auth_required(f):
@@ -35,14 +115,19 @@ def auth_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('auth.student_login'))
-        # Verify the user actually exists in the database (handles DB reset)
-        db = SessionLocal()
-        try:
-            user = get_user_by_id(db, session['user_id'])
-            if user is None:
-                session.clear()
-                return redirect(url_for('auth.student_login'))
-        finally:
-            db.close()
+        # Verify the user actually exists in the database (handles DB reset);
+        # served from the user cache, so only a cold entry costs a query
+        if get_current_user_from_session() is None:
+            session.clear()
+            return redirect(url_for('auth.student_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def api_auth_required(f):
+    """Decorator for JSON endpoints - 401 before the view (or a DB session) runs"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return {"detail": "Authentication required"}, 401
         return f(*args, **kwargs)
     return decorated_function
@@ -0,0 +1,38 @@
+"""
+Gunicorn settings for production: gunicorn -c gunicorn.conf.py run:app
+"""
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+# Read .env before the defaults below, so values set there still win
+load_dotenv()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Threads let a worker keep serving while another request waits on Postgres.
+# A thread holds at most one connection, so each worker's pool is sized to its
+# threads with no overflow (unless DB_POOL_SIZE/DB_MAX_OVERFLOW are set)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('DB_MAX_OVERFLOW', '0')
+
+# One process per core (plus one) so requests aren't serialized behind a single GIL,
+# capped so workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays within DB_MAX_CONNECTIONS,
+# the share of Postgres's max_connections (default 100) this app may use
+_connections_per_worker = int(os.environ['DB_POOL_SIZE']) + int(os.environ['DB_MAX_OVERFLOW'])
+_max_workers = max(1, int(os.getenv('DB_MAX_CONNECTIONS', 90)) // _connections_per_worker)
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, _max_workers)))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# Hold idle client connections open briefly for follow-up requests (assets, API calls)
+keepalive = 5
+
+
+def post_fork(server, worker):
+    # Each worker needs its own connection pool; never reuse sockets inherited from the master
+    from app.db import engine
+    engine.dispose(close=False)
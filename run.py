@@ -1,6 +1,8 @@
+import os
 from app import create_app
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001, host='127.0.0.1')
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', port=5001, host='127.0.0.1')